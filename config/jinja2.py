@@ -5,6 +5,8 @@ from django.urls import reverse
 
 
 def environment(**options):
+    # Django's Jinja2 backend calls this once per engine and caches the engine, so a
+    # module-level singleton would only leak options between engines (e.g. in tests).
     env = options.pop("environment", None)
     if env is not None:
         pass
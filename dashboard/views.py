@@ -4,16 +4,56 @@ from django import forms
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import F
 from django.db.models.deletion import ProtectedError
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 
-from shop.services import send_order_status_change_email
+from shop.services import run_in_background, send_order_status_change_email
 from shop.models import Coupon, Order, Product
 
+DASHBOARD_PAGE_SIZE = 25
+_ORDER_STATUSES = frozenset(value for value, _ in Order.Status.choices)
+# <option> lists for the status selects, keyed by the selected value ("" = none).
+_STATUS_OPTIONS_HTML = {
+    selected: mark_safe(
+        "".join(
+            format_html(
+                '<option value="{}"{}>{}</option>', value, " selected" if value == selected else "", label
+            )
+            for value, label in Order.Status.choices
+        )
+    )
+    for selected in ("", *_ORDER_STATUSES)
+}
+
+
+def _dashboard_counts() -> tuple[int, int, int]:
+    tables = [connection.ops.quote_name(m._meta.db_table) for m in (Product, Order, Coupon)]
+    sql = "SELECT " + ", ".join(f"(SELECT COUNT(*) FROM {t})" for t in tables)
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return tuple(cursor.fetchone())
+
+
+def _paginate(request, qs):
+    return Paginator(qs, DASHBOARD_PAGE_SIZE).get_page(request.GET.get("page"))
+
+
+def _is_staff(user) -> bool:
+    return user.is_staff
+
+
+_staff_test = user_passes_test(_is_staff, login_url="dashboard:login")
+
 
 def staff_required(view_func):
-    return login_required(user_passes_test(lambda u: u.is_staff, login_url="dashboard:login")(view_func))
+    return login_required(_staff_test(view_func))
 
 
 class LoginForm(forms.Form):
@@ -107,12 +147,15 @@ class CouponForm(forms.ModelForm):
         self.fields["discount_type"].widget.choices = Coupon.DiscountType.choices
         if not self.instance.pk:
             self.fields["discount_type"].initial = Coupon.DiscountType.FLAT
-        self.fields["applicable_products"].queryset = Product.objects.filter(
-            is_active=True
-        ).order_by("name")
+        self.fields["applicable_products"].queryset = (
+            Product.objects.filter(is_active=True).only("id", "name").order_by("name")
+        )
         self.fields["start_at"].input_formats = ["%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
         self.fields["end_at"].input_formats = ["%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
 
+    def clean_code(self):
+        return (self.cleaned_data.get("code") or "").strip().upper()
+
     def clean_discount_value(self):
         value = self.cleaned_data.get("discount_value")
         if value is not None and value < 0:
@@ -154,9 +197,7 @@ def logout_view(request):
 @staff_required
 def dashboard_home(request):
     orders = Order.objects.order_by("-created_at")[:5]
-    products_count = Product.objects.count()
-    orders_count = Order.objects.count()
-    coupons_count = Coupon.objects.count()
+    products_count, orders_count, coupons_count = _dashboard_counts()
     return render(
         request,
         "dashboard/home.html",
@@ -171,8 +212,11 @@ def dashboard_home(request):
 
 @staff_required
 def product_list(request):
-    products = Product.objects.order_by("name")
-    return render(request, "dashboard/product_list.html", {"products": products})
+    products = Product.objects.only(
+        "id", "name", "price", "stock_quantity", "is_active", "image"
+    ).order_by("name")
+    page_obj = _paginate(request, products)
+    return render(request, "dashboard/product_list.html", {"products": page_obj, "page_obj": page_obj})
 
 
 @staff_required
@@ -214,8 +258,12 @@ def product_delete(request, pk: int):
 
 @staff_required
 def coupon_list(request):
-    coupons = Coupon.objects.order_by("-created_at")
-    return render(request, "dashboard/coupon_list.html", {"coupons": coupons, "now": timezone.now()})
+    page_obj = _paginate(request, Coupon.objects.order_by("-created_at"))
+    return render(
+        request,
+        "dashboard/coupon_list.html",
+        {"coupons": page_obj, "page_obj": page_obj, "now": timezone.now()},
+    )
 
 
 @staff_required
@@ -241,9 +289,8 @@ def coupon_edit(request, pk: int):
 
 @staff_required
 def coupon_toggle_enabled(request, pk: int):
-    coupon = get_object_or_404(Coupon, pk=pk)
-    coupon.is_enabled = not coupon.is_enabled
-    coupon.save(update_fields=["is_enabled"])
+    if not Coupon.objects.filter(pk=pk).update(is_enabled=~F("is_enabled"), updated_at=timezone.now()):
+        raise Http404("No Coupon matches the given query.")
     return redirect("dashboard:coupon_list")
 
 
@@ -253,29 +300,41 @@ def order_list(request):
     qs = Order.objects.select_related("coupon").order_by("-created_at")
     if status_filter:
         qs = qs.filter(status=status_filter)
+    page_obj = _paginate(request, qs)
     return render(
         request,
         "dashboard/order_list.html",
-        {"orders": qs, "status_filter": status_filter, "order_status_choices": Order.Status.choices},
+        {
+            "orders": page_obj,
+            "page_obj": page_obj,
+            "status_filter": status_filter,
+            "status_options_html": _STATUS_OPTIONS_HTML.get(status_filter, _STATUS_OPTIONS_HTML[""]),
+        },
     )
 
 
 @staff_required
 def order_detail(request, pk: int):
-    order = get_object_or_404(Order.objects.select_related("coupon"), pk=pk)
+    order = get_object_or_404(
+        Order.objects.select_related("coupon", "user").prefetch_related("items"), pk=pk
+    )
     return render(request, "dashboard/order_detail.html", {"order": order})
 
 
 @staff_required
 def order_update_status(request, pk: int):
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(Order.objects.select_related("user"), pk=pk)
     if request.method == "POST":
         new_status = request.POST.get("status")
-        if new_status in dict(Order.Status.choices):
+        if new_status in _ORDER_STATUSES:
             order.status = new_status
             order.save(update_fields=["status"])
-            send_order_status_change_email(order)
+            run_in_background(send_order_status_change_email, order)
             messages.success(request, "Order status updated and customer notified by email.")
         return redirect("dashboard:order_detail", pk=order.pk)
-    return render(request, "dashboard/order_status_form.html", {"order": order})
+    return render(
+        request,
+        "dashboard/order_status_form.html",
+        {"order": order, "status_options_html": _STATUS_OPTIONS_HTML.get(order.status, _STATUS_OPTIONS_HTML[""])},
+    )
 
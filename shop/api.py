@@ -1,20 +1,33 @@
 from __future__ import annotations
 
-import random
-import string
+import uuid
+from datetime import datetime
 from decimal import Decimal
 
 from django.contrib.auth import authenticate, get_user_model
+from django.core.cache import cache
 from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch, prefetch_related_objects
+from django.db.models.functions import Lower
 from django.utils import timezone
+from django.views.decorators.http import condition
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema
 
-from shop.constants import CART_TOKEN_HEADER, CART_TOKEN_QUERY_PARAM
+from shop.constants import (
+    CART_TOKEN_HEADER,
+    CART_TOKEN_QUERY_PARAM,
+    ORDER_LIST_MAX_PAGE_SIZE,
+    ORDER_LIST_PAGE_SIZE,
+    PRODUCT_DETAIL_CACHE_KEY,
+    PRODUCTS_CACHE_TIMEOUT,
+    PRODUCTS_LIST_CACHE_KEY,
+)
 from shop.models import (
     Cart,
     CartItem,
@@ -22,16 +35,20 @@ from shop.models import (
     EmailChangeRequest,
     EmailVerificationCode,
     Order,
+    OrderItem,
     Product,
     UserProfile,
+    _generate_otp,
     create_order_from_cart,
 )
 from shop.services import (
+    deliver_email_change_otp,
+    deliver_registration_otp,
     get_min_order_amount,
     get_otp_expire_minutes,
-    send_email_change_otp,
+    get_products_state,
+    run_in_background,
     send_order_confirmation_email,
-    send_otp_email,
 )
 from shop.serializers import (
     AvatarUploadSerializer,
@@ -43,64 +60,124 @@ from shop.serializers import (
     LoginSerializer,
     OrderCreateSerializer,
     OrderSerializer,
+    PRODUCT_SERIALIZER_COLUMNS,
     ProductSerializer,
     ProfileUpdateSerializer,
     RegisterSerializer,
     VerifyEmailSerializer,
     VerifyEmailChangeSerializer,
+    serialize_product_rows,
 )
 
 User = get_user_model()
 
 
+class _OrderListPagination(LimitOffsetPagination):
+    default_limit = ORDER_LIST_PAGE_SIZE
+    max_limit = ORDER_LIST_MAX_PAGE_SIZE
+
+
 def _merge_guest_cart_into_user_cart(user_cart: Cart, guest_cart: Cart) -> None:
-    for guest_item in guest_cart.items.select_related("product").all():
-        existing = user_cart.items.filter(product=guest_item.product).first()
+    existing_items = {item.product_id: item for item in user_cart.items.all()}
+    changed, created = [], []
+    now = timezone.now()
+    for guest_item in guest_cart.items.select_related("product"):
+        existing = existing_items.get(guest_item.product_id)
         if existing:
             existing.quantity += guest_item.quantity
             existing.unit_price = guest_item.product.price
-            existing.save(update_fields=["quantity", "unit_price", "updated_at"])
+            existing.updated_at = now
+            changed.append(existing)
         else:
-            CartItem.objects.create(
-                cart=user_cart,
-                product=guest_item.product,
-                quantity=guest_item.quantity,
-                unit_price=guest_item.product.price,
+            created.append(
+                CartItem(
+                    cart=user_cart,
+                    product=guest_item.product,
+                    quantity=guest_item.quantity,
+                    unit_price=guest_item.product.price,
+                )
             )
+    if changed:
+        CartItem.objects.bulk_update(changed, ["quantity", "unit_price", "updated_at"])
+    if created:
+        CartItem.objects.bulk_create(created)
     guest_cart.items.all().delete()
 
 
 def _get_or_create_cart(request) -> Cart:
-    if request.user.is_authenticated:
-        user_cart, _ = Cart.objects.get_or_create(
-            user=request.user, checked_out_at__isnull=True
-        )
-        if user_cart.total_items() == 0:
-            token = request.headers.get(CART_TOKEN_HEADER) or request.query_params.get(
-                CART_TOKEN_QUERY_PARAM
-            )
-            if token:
-                try:
-                    guest_cart = Cart.objects.get(
-                        guest_token=token, checked_out_at__isnull=True
-                    )
-                    if guest_cart.total_items() > 0:
-                        _merge_guest_cart_into_user_cart(user_cart, guest_cart)
-                except Cart.DoesNotExist:
-                    pass
-        return user_cart
+    cart = getattr(request, "_cart", None)
+    if cart is None:
+        cart = request._cart = _resolve_cart(request)
+    return cart
 
+
+def _get_guest_cart(token) -> Cart | None:
+    try:
+        token = uuid.UUID(str(token))
+    except ValueError:
+        return None
+    return Cart.objects.filter(guest_token=token, checked_out_at__isnull=True).first()
+
+
+def _get_active_user_cart(user) -> Cart:
+    cart = Cart.objects.filter(user=user, checked_out_at__isnull=True).first()
+    if cart is None:
+        try:
+            with transaction.atomic():
+                cart = Cart.objects.create(user=user)
+        except IntegrityError:
+            cart = Cart.objects.get(user=user, checked_out_at__isnull=True)
+    return cart
+
+
+def _resolve_cart(request) -> Cart:
     token = request.headers.get(CART_TOKEN_HEADER) or request.query_params.get(
         CART_TOKEN_QUERY_PARAM
     )
+    if request.user.is_authenticated:
+        user_cart = _get_active_user_cart(request.user)
+        if token and not user_cart.items.exists():
+            guest_cart = _get_guest_cart(token)
+            if guest_cart is not None and guest_cart.items.exists():
+                _merge_guest_cart_into_user_cart(user_cart, guest_cart)
+        return user_cart
+
     if token:
-        try:
-            return Cart.objects.get(guest_token=token, checked_out_at__isnull=True)
-        except Cart.DoesNotExist:
-            pass
+        guest_cart = _get_guest_cart(token)
+        if guest_cart is not None:
+            return guest_cart
     return Cart.objects.create()
 
 
+def _related_product_columns(relation: str) -> list[str]:
+    return [f"{relation}__{name}" for name in PRODUCT_SERIALIZER_COLUMNS]
+
+
+def _cart_with_items(cart: Cart) -> Cart:
+    items = CartItem.objects.select_related("product").only(
+        "id",
+        "cart",
+        "quantity",
+        "unit_price",
+        "created_at",
+        "updated_at",
+        *_related_product_columns("product"),
+    )
+    prefetch_related_objects([cart], Prefetch("items", queryset=items))
+    return cart
+
+
+def _order_items_prefetch() -> Prefetch:
+    items = OrderItem.objects.select_related("product").only(
+        "id", "order", "product_name", "quantity", "unit_price", "line_total", *_related_product_columns("product")
+    )
+    return Prefetch("items", queryset=items)
+
+
+def _serialize_cart(cart: Cart, request):
+    return CartSerializer(_cart_with_items(cart), context={"request": request}).data
+
+
 def _profile_response(user, request=None):
     data = {
         "id": user.id,
@@ -109,14 +186,13 @@ def _profile_response(user, request=None):
         "first_name": user.first_name or "",
         "last_name": user.last_name or "",
     }
-    try:
-        profile = user.shop_profile
-        if profile.avatar:
-            url = profile.avatar.url
-            data["avatar_url"] = request.build_absolute_uri(url) if request else url
-        else:
-            data["avatar_url"] = None
-    except UserProfile.DoesNotExist:
+    # The reverse one-to-one raises an AttributeError subclass when missing;
+    # a cached profile (e.g. from get_or_create) is reused without a query.
+    profile = getattr(user, "shop_profile", None)
+    if profile is not None and profile.avatar:
+        url = profile.avatar.url
+        data["avatar_url"] = request.build_absolute_uri(url) if request else url
+    else:
         data["avatar_url"] = None
     return data
 
@@ -134,16 +210,8 @@ def register(request):
             {"detail": "A user with this username or email already exists."},
             status=status.HTTP_400_BAD_REQUEST,
         )
-    rec = EmailVerificationCode.create_for_email(user.email)
-    try:
-        send_otp_email(user.email, rec.code)
-    except Exception:
-        rec.delete()
-        user.delete()
-        return Response(
-            {"detail": "Failed to send verification email. Check email configuration."},
-            status=status.HTTP_503_SERVICE_UNAVAILABLE,
-        )
+    rec = EmailVerificationCode.create_for_email(user.email, user=user)
+    run_in_background(deliver_registration_otp, user.pk, user.email, rec.code)
     return Response({
         "message": "Check your email for the verification code (OTP).",
         "email": user.email,
@@ -159,14 +227,14 @@ def verify_email(request):
     email = s.validated_data["email"].strip().lower()
     otp = s.validated_data["otp"].strip()
     try:
-        rec = EmailVerificationCode.objects.get(email__iexact=email, code=otp)
+        rec = EmailVerificationCode.objects.select_related("user").get(email=email, code=otp)
     except EmailVerificationCode.DoesNotExist:
         return Response({"detail": "Invalid or expired code."}, status=status.HTTP_400_BAD_REQUEST)
     delta = timezone.now() - rec.created_at
     if delta.total_seconds() > get_otp_expire_minutes() * 60:
         rec.delete()
         return Response({"detail": "Code expired. Please request a new one."}, status=status.HTTP_400_BAD_REQUEST)
-    user = User.objects.filter(email__iexact=email).first()
+    user = rec.user or User.objects.alias(email_ci=Lower("email")).filter(email_ci=email).first()
     if not user:
         rec.delete()
         return Response({"detail": "User not found."}, status=status.HTTP_400_BAD_REQUEST)
@@ -195,27 +263,93 @@ def login(request):
     return Response({"token": token.key})
 
 
+def _products_state(request) -> tuple[datetime | None, int]:
+    # Shared by condition() and the view, so the aggregate runs once per request.
+    request = getattr(request, "_request", request)
+    if not hasattr(request, "_products_state"):
+        request._products_state = get_products_state()
+    return request._products_state
+
+
+def _products_list_last_modified(request):
+    return _products_state(request)[0]
+
+
+def _products_list_etag(request):
+    last_modified, count = _products_state(request)
+    return f"{count}-{last_modified.timestamp() if last_modified else 0}"
+
+
+def _product_updated_at(request, product_id: int) -> datetime | None:
+    request = getattr(request, "_request", request)
+    cached = getattr(request, "_product_updated_at", None)
+    if cached is None or cached[0] != product_id:
+        updated_at = (
+            Product.objects.filter(is_active=True, id=product_id).values_list("updated_at", flat=True).first()
+        )
+        request._product_updated_at = cached = (product_id, updated_at)
+    return cached[1]
+
+
+def _product_detail_etag(request, product_id: int):
+    # None for a missing product, so condition() neither sets validators nor answers 304.
+    updated_at = _product_updated_at(request, product_id)
+    return None if updated_at is None else f"{product_id}-{updated_at.timestamp()}"
+
+
+@condition(etag_func=_products_list_etag, last_modified_func=_products_list_last_modified)
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def products_list(request):
-    qs = Product.objects.filter(is_active=True).order_by("id")
-    return Response(ProductSerializer(qs, many=True, context={"request": request}).data)
+    key = PRODUCTS_LIST_CACHE_KEY.format(
+        version=_products_list_etag(request),
+        base_url=request.build_absolute_uri("/"),
+    )
+    data = cache.get(key)
+    if data is None:
+        rows = (
+            Product.objects.filter(is_active=True)
+            .order_by("id")
+            .values(*PRODUCT_SERIALIZER_COLUMNS)
+        )
+        data = serialize_product_rows(rows, request)
+        cache.set(key, data, PRODUCTS_CACHE_TIMEOUT)
+    return Response(data)
 
 
+@condition(etag_func=_product_detail_etag, last_modified_func=_product_updated_at)
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def product_detail(request, product_id: int):
-    product = Product.objects.filter(is_active=True, id=product_id).first()
-    if not product:
+    version = _product_detail_etag(request, product_id)
+    if version is None:
         return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
-    return Response(ProductSerializer(product, context={"request": request}).data)
+    key = PRODUCT_DETAIL_CACHE_KEY.format(
+        version=version,
+        product_id=product_id,
+        base_url=request.build_absolute_uri("/"),
+    )
+    data = cache.get(key)
+    if data is None:
+        product = Product.objects.filter(is_active=True, id=product_id).only(*PRODUCT_SERIALIZER_COLUMNS).first()
+        if not product:
+            return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
+        data = ProductSerializer(product, context={"request": request}).data
+        cache.set(key, data, PRODUCTS_CACHE_TIMEOUT)
+    return Response(data)
 
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def cart_detail(request):
     cart = _get_or_create_cart(request)
-    return Response(CartSerializer(cart, context={"request": request}).data)
+    return Response(_serialize_cart(cart, request))
+
+
+def _add_to_cart_item(cart: Cart, product: Product, quantity: int) -> int:
+    return CartItem.objects.filter(
+        cart=cart, product=product, quantity__lte=product.stock_quantity - quantity
+    ).update(quantity=F("quantity") + quantity, unit_price=product.price, updated_at=timezone.now())
 
 
 @extend_schema(request=CartItemSerializer, responses={200: CartSerializer})
@@ -232,18 +366,15 @@ def cart_item_add(request):
     if quantity > product.stock_quantity:
         return Response({"detail": "Insufficient stock."}, status=status.HTTP_400_BAD_REQUEST)
 
-    item, created = CartItem.objects.select_for_update().get_or_create(
-        cart=cart, product=product, defaults={"quantity": quantity, "unit_price": product.price}
-    )
-    if not created:
-        new_qty = item.quantity + quantity
-        if new_qty > product.stock_quantity:
-            return Response({"detail": "Insufficient stock."}, status=status.HTTP_400_BAD_REQUEST)
-        item.quantity = new_qty
-        item.unit_price = product.price
-        item.save(update_fields=["quantity", "unit_price", "updated_at"])
+    if not _add_to_cart_item(cart, product, quantity):
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart=cart, product=product, quantity=quantity, unit_price=product.price)
+        except IntegrityError:
+            if not _add_to_cart_item(cart, product, quantity):
+                return Response({"detail": "Insufficient stock."}, status=status.HTTP_400_BAD_REQUEST)
 
-    return Response(CartSerializer(cart, context={"request": request}).data, status=status.HTTP_200_OK)
+    return Response(_serialize_cart(cart, request), status=status.HTTP_200_OK)
 
 
 @extend_schema(request=CartItemUpdateSerializer, responses={200: CartSerializer})
@@ -253,7 +384,11 @@ def cart_item_add(request):
 def cart_item_update(request, item_id: int):
     cart = _get_or_create_cart(request)
     try:
-        item = CartItem.objects.select_for_update().select_related("product").get(cart=cart, id=item_id)
+        item = (
+            CartItem.objects.select_for_update(of=("self",), no_key=True)
+            .select_related("product")
+            .get(cart=cart, id=item_id)
+        )
     except CartItem.DoesNotExist:
         return Response({"detail": "Item not found."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -272,7 +407,7 @@ def cart_item_update(request, item_id: int):
     item.quantity = qty
     item.unit_price = item.product.price
     item.save(update_fields=["quantity", "unit_price", "updated_at"])
-    return Response(CartSerializer(cart, context={"request": request}).data)
+    return Response(_serialize_cart(cart, request))
 
 
 @api_view(["DELETE"])
@@ -280,7 +415,7 @@ def cart_item_update(request, item_id: int):
 def cart_item_delete(request, item_id: int):
     cart = _get_or_create_cart(request)
     CartItem.objects.filter(cart=cart, id=item_id).delete()
-    return Response(CartSerializer(cart, context={"request": request}).data)
+    return Response(_serialize_cart(cart, request))
 
 
 @extend_schema(request=CouponValidateSerializer, responses={200: CouponValidationResultSerializer})
@@ -290,18 +425,19 @@ def coupon_validate(request):
     cart = _get_or_create_cart(request)
     s = CouponValidateSerializer(data=request.data)
     s.is_valid(raise_exception=True)
-    code = s.validated_data["code"].strip()
+    code = s.validated_data["code"].strip().upper()
     try:
-        coupon = Coupon.objects.get(code__iexact=code)
+        coupon = Coupon.objects.prefetch_related("applicable_products").get(code=code)
     except Coupon.DoesNotExist:
         return Response({"detail": "Invalid coupon code."}, status=status.HTTP_400_BAD_REQUEST)
 
-    ok, msg = coupon.is_applicable_to_cart(cart)
+    cart = _cart_with_items(cart)
+    subtotal = cart.subtotal()
+    ok, msg = coupon.is_applicable_to_cart(cart, subtotal)
     if not ok:
         return Response({"detail": msg}, status=status.HTTP_400_BAD_REQUEST)
 
-    subtotal = cart.subtotal()
-    discount = coupon.compute_discount(cart)
+    discount = coupon.compute_discount(cart, subtotal)
     total = (subtotal - discount).quantize(Decimal("0.01"))
 
     data = CouponValidationResultSerializer(
@@ -321,11 +457,25 @@ def order_list(request):
     qs = (
         Order.objects.filter(user=request.user)
         .select_related("coupon")
-        .prefetch_related("items__product")
+        .only(
+            "id",
+            "status",
+            "guest_full_name",
+            "guest_email",
+            "coupon__code",
+            "subtotal_amount",
+            "discount_amount",
+            "total_amount",
+            "item_count",
+            "created_at",
+        )
+        .prefetch_related(_order_items_prefetch())
         .order_by("-created_at")
     )
-    return Response(
-        OrderSerializer(qs, many=True, context={"request": request}).data
+    paginator = _OrderListPagination()
+    page = paginator.paginate_queryset(qs, request)
+    return paginator.get_paginated_response(
+        OrderSerializer(page, many=True, context={"request": request}).data
     )
 
 
@@ -341,7 +491,7 @@ def order_create(request):
     code = (s.validated_data.get("coupon_code") or "").strip()
     if code:
         try:
-            coupon = Coupon.objects.get(code__iexact=code)
+            coupon = Coupon.objects.get(code=code.upper())
         except Coupon.DoesNotExist:
             return Response({"detail": "Invalid coupon code."}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -356,11 +506,8 @@ def order_create(request):
         )
     except ValueError as e:
         return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-
-    try:
-        send_order_confirmation_email(order)
-    except Exception:
-        pass
+    prefetch_related_objects([order], _order_items_prefetch())
+    run_in_background(send_order_confirmation_email, order)
 
     return Response(OrderSerializer(order, context={"request": request}).data, status=status.HTTP_201_CREATED)
 
@@ -384,22 +531,15 @@ def profile_update(request):
         user.last_name = (s.validated_data["last_name"] or "").strip()
     new_email = (s.validated_data.get("email") or "").strip().lower()
     if new_email and new_email != (user.email or "").strip().lower():
-        if User.objects.filter(email__iexact=new_email).exclude(pk=user.pk).exists():
+        if User.objects.alias(email_ci=Lower("email")).filter(email_ci=new_email).exclude(pk=user.pk).exists():
             return Response(
                 {"detail": "A user with this email already exists."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
         EmailChangeRequest.objects.filter(user=user).delete()
-        code = "".join(random.choices(string.digits, k=6))
+        code = _generate_otp(6)
         req = EmailChangeRequest.objects.create(user=user, new_email=new_email, code=code)
-        try:
-            send_email_change_otp(req.new_email, req.code)
-        except Exception:
-            req.delete()
-            return Response(
-                {"detail": "Failed to send verification email. Try again later."},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE,
-            )
+        run_in_background(deliver_email_change_otp, req.pk, req.new_email, req.code)
         user.save(update_fields=["first_name", "last_name"])
         return Response({
             **_profile_response(user, request),
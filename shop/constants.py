@@ -8,3 +8,13 @@ SETTING_DEFAULT_FROM_EMAIL = "DEFAULT_FROM_EMAIL"
 DEFAULT_OTP_EXPIRE_MINUTES = 15
 DEFAULT_MIN_ORDER_AMOUNT = "0"
 DEFAULT_FROM_EMAIL = "noreply@example.com"
+
+EMAIL_SEND_ATTEMPTS = 3
+EMAIL_RETRY_DELAY_SECONDS = 2
+
+PRODUCTS_LIST_CACHE_KEY = "products:list:{version}:{base_url}"
+PRODUCT_DETAIL_CACHE_KEY = "products:detail:{version}:{product_id}:{base_url}"
+PRODUCTS_CACHE_TIMEOUT = 60
+
+ORDER_LIST_PAGE_SIZE = 25
+ORDER_LIST_MAX_PAGE_SIZE = 100
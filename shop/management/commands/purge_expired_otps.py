@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.models import EmailChangeRequest, EmailVerificationCode
+from shop.services import get_otp_expire_minutes
+
+
+class Command(BaseCommand):
+    help = "Delete expired email verification and email change codes."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=get_otp_expire_minutes())
+        codes_deleted, _ = EmailVerificationCode.objects.filter(created_at__lt=cutoff).delete()
+        changes_deleted, _ = EmailChangeRequest.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(
+            f"Deleted {codes_deleted} verification code(s) and {changes_deleted} email change request(s)."
+        )
@@ -0,0 +1,35 @@
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models.functions import Trim, Upper
+
+
+def uppercase_coupon_codes(apps, schema_editor):
+    Coupon = apps.get_model("shop", "Coupon")
+    codes = defaultdict(list)
+    for coupon_id, code in Coupon.objects.order_by("id").values_list("id", "code"):
+        codes[code.strip().upper()].append(f"{code!r} (id={coupon_id})")
+    clashes = {normalized: found for normalized, found in codes.items() if len(found) > 1}
+    if clashes:
+        details = "; ".join(f"{normalized}: {', '.join(found)}" for normalized, found in sorted(clashes.items()))
+        raise RuntimeError(
+            "Cannot uppercase coupon codes: these coupons differ only in case or surrounding "
+            f"whitespace and would violate the unique constraint on code. Rename or delete "
+            f"them, then re-run the migration. {details}"
+        )
+    Coupon.objects.update(code=Upper(Trim("code")))
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_add_product_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(uppercase_coupon_codes, noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-14 03:50
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def close_duplicate_active_carts(apps, schema_editor):
+    Cart = apps.get_model("shop", "Cart")
+    seen = set()
+    duplicates = []
+    active = Cart.objects.filter(user__isnull=False, checked_out_at__isnull=True).order_by(
+        "user_id", "-updated_at", "-id"
+    )
+    for cart_id, user_id in active.values_list("id", "user_id"):
+        if user_id in seen:
+            duplicates.append(cart_id)
+        seen.add(user_id)
+    if duplicates:
+        Cart.objects.filter(id__in=duplicates).update(checked_out_at=timezone.now())
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_uppercase_coupon_codes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='cartitem',
+            options={'ordering': ['id']},
+        ),
+        migrations.RunPython(close_duplicate_active_carts, noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('checked_out_at__isnull', True)), fields=('user',), name='uniq_active_cart_per_user'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-14 03:51
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def normalize_otp_emails(apps, schema_editor):
+    EmailVerificationCode = apps.get_model("shop", "EmailVerificationCode")
+    seen = set()
+    for rec in EmailVerificationCode.objects.order_by("-created_at", "-id"):
+        email = rec.email.lower()
+        if email in seen:
+            rec.delete()
+            continue
+        seen.add(email)
+        if rec.email != email:
+            rec.email = email
+            rec.save(update_fields=["email"])
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_cart_active_user_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_otp_emails, noop),
+        migrations.AddIndex(
+            model_name='emailverificationcode',
+            index=models.Index(fields=['created_at'], name='shop_emailv_created_c48906_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='emailverificationcode',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='uniq_otp_email_ci'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-14 03:56
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_snapshots(apps, schema_editor):
+    Order = apps.get_model("shop", "Order")
+    OrderItem = apps.get_model("shop", "OrderItem")
+    Product = apps.get_model("shop", "Product")
+    OrderItem.objects.update(
+        product_name=Subquery(Product.objects.filter(pk=OuterRef("product_id")).values("name")[:1])
+    )
+    counts = (
+        OrderItem.objects.filter(order=OuterRef("pk"))
+        .values("order")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    Order.objects.update(item_count=Coalesce(Subquery(counts), 0))
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_emailverificationcode_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.RunPython(backfill_snapshots, noop),
+    ]
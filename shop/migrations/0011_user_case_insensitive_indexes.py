@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-14 04:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+# Functional indexes on the user table backing the Lower(...) lookups used
+# by registration and email changes. The user model belongs to another app,
+# so the indexes are created directly rather than through model state.
+USER_CI_INDEXES = [
+    models.Index(Lower("username"), name="user_username_ci"),
+    models.Index(Lower("email"), name="user_email_ci"),
+]
+
+
+def add_user_indexes(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    for index in USER_CI_INDEXES:
+        schema_editor.add_index(User, index)
+
+
+def remove_user_indexes(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    for index in USER_CI_INDEXES:
+        schema_editor.remove_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_order_item_snapshots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(add_user_indexes, remove_user_indexes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-14 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_user_case_insensitive_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='shop_produc_updated_48807c_idx'),
+        ),
+    ]
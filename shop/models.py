@@ -1,34 +1,52 @@
 from __future__ import annotations
 
-import random
-import string
+import secrets
 import uuid
 from decimal import Decimal
 
 from django.conf import settings
 from django.core.validators import MinValueValidator
 from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 
 def _generate_otp(length=6):
-    return "".join(random.choices(string.digits, k=length))
+    return f"{secrets.randbelow(10 ** length):0{length}d}"
+
+
+def _to_cents(amount: Decimal) -> int:
+    return int(amount * 100)
+
+
+def _from_cents(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
 
 
 class EmailVerificationCode(models.Model):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="email_verification_codes",
+    )
     email = models.EmailField()
     code = models.CharField(max_length=10)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        indexes = [models.Index(fields=["email"])]
+        indexes = [models.Index(fields=["email"]), models.Index(fields=["created_at"])]
+        constraints = [models.UniqueConstraint(Lower("email"), name="uniq_otp_email_ci")]
         ordering = ["-created_at"]
 
     @staticmethod
-    def create_for_email(email):
-        code = _generate_otp(6)
-        EmailVerificationCode.objects.filter(email__iexact=email).delete()
-        return EmailVerificationCode.objects.create(email=email, code=code)
+    def create_for_email(email, user=None):
+        rec, _ = EmailVerificationCode.objects.update_or_create(
+            email=email.lower(),
+            defaults={"user": user, "code": _generate_otp(6), "created_at": timezone.now()},
+        )
+        return rec
 
 
 class EmailChangeRequest(models.Model):
@@ -70,6 +88,9 @@ class Product(TimestampedModel):
     is_active = models.BooleanField(default=True)
     image = models.ImageField(upload_to="products/", blank=True, null=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["updated_at"])]
+
     def __str__(self) -> str:
         return self.name
 
@@ -117,6 +138,11 @@ class Coupon(TimestampedModel):
     def __str__(self) -> str:
         return self.code
 
+    def save(self, *args, **kwargs):
+        if self.code:
+            self.code = self.code.strip().upper()
+        super().save(*args, **kwargs)
+
     def is_active_now(self) -> bool:
         if not self.is_enabled:
             return False
@@ -127,25 +153,32 @@ class Coupon(TimestampedModel):
             return False
         return True
 
-    def is_applicable_to_cart(self, cart: "Cart") -> tuple[bool, str]:
+    def is_applicable_to_cart(self, cart: "Cart", subtotal: Decimal | None = None) -> tuple[bool, str]:
         if not self.is_active_now():
             return False, "Coupon is expired or disabled."
 
-        subtotal = cart.subtotal()
+        if subtotal is None:
+            subtotal = cart.subtotal()
         if subtotal < self.minimum_cart_value:
             return False, "Minimum cart value not met for this coupon."
 
-        restricted = self.applicable_products.exists()
-        if restricted:
-            product_ids = set(cart.items.values_list("product_id", flat=True))
-            allowed_ids = set(self.applicable_products.values_list("id", flat=True))
-            if product_ids.isdisjoint(allowed_ids):
-                return False, "Coupon is not applicable to items in your cart."
+        if "applicable_products" in getattr(self, "_prefetched_objects_cache", {}):
+            allowed_ids = {product.id for product in self.applicable_products.all()}
+            if allowed_ids:
+                product_ids = {item.product_id for item in cart.items.all()}
+                if product_ids.isdisjoint(allowed_ids):
+                    return False, "Coupon is not applicable to items in your cart."
+        elif (
+            self.applicable_products.exists()
+            and not self.applicable_products.filter(cart_items__cart=cart).exists()
+        ):
+            return False, "Coupon is not applicable to items in your cart."
 
         return True, ""
 
-    def compute_discount(self, cart: "Cart") -> Decimal:
-        subtotal = cart.subtotal()
+    def compute_discount(self, cart: "Cart", subtotal: Decimal | None = None) -> Decimal:
+        if subtotal is None:
+            subtotal = cart.subtotal()
 
         if self.discount_type == self.DiscountType.PERCENTAGE:
             pct = (self.discount_value / Decimal("100")).quantize(Decimal("0.0001"))
@@ -161,17 +194,42 @@ class Cart(TimestampedModel):
     guest_token = models.UUIDField(default=uuid.uuid4, unique=True, blank=True, null=True)
     checked_out_at = models.DateTimeField(blank=True, null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user"],
+                condition=models.Q(checked_out_at__isnull=True),
+                name="uniq_active_cart_per_user",
+            )
+        ]
+
     def __str__(self) -> str:
         return f"Cart {self.id}"
 
+    def _items_prefetched(self) -> bool:
+        return "items" in getattr(self, "_prefetched_objects_cache", {})
+
     def subtotal(self) -> Decimal:
-        total = Decimal("0.00")
-        for item in self.items.select_related("product").all():
-            total += (item.unit_price * item.quantity)
-        return total.quantize(Decimal("0.01"))
+        return self.totals()[0]
 
     def total_items(self) -> int:
-        return int(self.items.aggregate(models.Sum("quantity")).get("quantity__sum") or 0)
+        return self.totals()[1]
+
+    def totals(self) -> tuple[Decimal, int]:
+        if not self._items_prefetched():
+            agg = self.items.aggregate(
+                total=models.Sum(
+                    models.F("unit_price") * models.F("quantity"),
+                    output_field=models.DecimalField(max_digits=14, decimal_places=2),
+                ),
+                count=models.Sum("quantity"),
+            )
+            return (agg["total"] or Decimal("0.00")).quantize(Decimal("0.01")), int(agg["count"] or 0)
+        cents = count = 0
+        for item in self.items.all():
+            cents += _to_cents(item.unit_price) * item.quantity
+            count += item.quantity
+        return _from_cents(cents), count
 
 
 class CartItem(TimestampedModel):
@@ -206,6 +264,7 @@ class Order(TimestampedModel):
     subtotal_amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
     discount_amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
     total_amount = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
+    item_count = models.PositiveIntegerField(default=0)
 
     def __str__(self) -> str:
         return f"Order {self.id}"
@@ -214,12 +273,14 @@ class Order(TimestampedModel):
 class OrderItem(TimestampedModel):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name="order_items")
+    # Snapshot of the product name at checkout, so order lines render without a join.
+    product_name = models.CharField(max_length=200, blank=True)
     quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
     unit_price = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
     line_total = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
 
     def __str__(self) -> str:
-        return f"{self.product} x {self.quantity}"
+        return f"{self.product_name} x {self.quantity}"
 
 
 @transaction.atomic
@@ -232,7 +293,7 @@ def create_order_from_cart(
     coupon: Coupon | None = None,
     min_order_amount: Decimal = Decimal("0.00"),
 ) -> Order:
-    if cart.items.select_related("product").count() == 0:
+    if not cart.items.exists():
         raise ValueError("Cart is empty.")
 
     subtotal = cart.subtotal()
@@ -241,22 +302,28 @@ def create_order_from_cart(
 
     discount = Decimal("0.00")
     if coupon is not None:
-        ok, msg = coupon.is_applicable_to_cart(cart)
+        ok, msg = coupon.is_applicable_to_cart(cart, subtotal)
         if not ok:
             raise ValueError(msg)
-        discount = coupon.compute_discount(cart)
+        discount = coupon.compute_discount(cart, subtotal)
 
     total = (subtotal - discount).quantize(Decimal("0.01"))
     if total < 0:
         total = Decimal("0.00")
 
-    for item in cart.items.select_related("product").select_for_update():
+    items = list(cart.items.select_related("product").select_for_update())
+    for item in items:
         if item.quantity > item.product.stock_quantity:
             raise ValueError(f"Insufficient stock for {item.product.name}.")
 
-    for item in cart.items.select_related("product").select_for_update():
-        item.product.stock_quantity -= item.quantity
-        item.product.save(update_fields=["stock_quantity"])
+    Product.objects.filter(pk__in=[item.product_id for item in items]).update(
+        stock_quantity=models.F("stock_quantity")
+        - models.Case(
+            *[models.When(pk=item.product_id, then=models.Value(item.quantity)) for item in items],
+            output_field=models.PositiveIntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
 
     order = Order.objects.create(
         user=user,
@@ -266,16 +333,22 @@ def create_order_from_cart(
         subtotal_amount=subtotal,
         discount_amount=discount,
         total_amount=total,
+        item_count=sum(item.quantity for item in items),
     )
 
-    for item in cart.items.select_related("product").all():
-        OrderItem.objects.create(
-            order=order,
-            product=item.product,
-            quantity=item.quantity,
-            unit_price=item.unit_price,
-            line_total=(item.unit_price * item.quantity).quantize(Decimal("0.01")),
-        )
+    OrderItem.objects.bulk_create(
+        [
+            OrderItem(
+                order=order,
+                product=item.product,
+                product_name=item.product.name,
+                quantity=item.quantity,
+                unit_price=item.unit_price,
+                line_total=(item.unit_price * item.quantity).quantize(Decimal("0.01")),
+            )
+            for item in items
+        ]
+    )
 
     if coupon is not None:
         Coupon.objects.filter(pk=coupon.pk).update(times_used=models.F("times_used") + 1)
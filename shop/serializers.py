@@ -4,11 +4,13 @@ from decimal import Decimal
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.db.models.functions import Lower
 from rest_framework import serializers
 
 from shop.models import Cart, CartItem, Coupon, Order, OrderItem, Product
 
 User = get_user_model()
+_USER_MGR = User._default_manager
 
 
 class RegisterSerializer(serializers.Serializer):
@@ -19,21 +21,31 @@ class RegisterSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True, min_length=8)
 
     def validate_username(self, value: str) -> str:
-        if User.objects.filter(username__iexact=value.strip()).exists():
-            raise serializers.ValidationError("A user with this username already exists.")
         return value.strip()
 
     def validate_email(self, value: str) -> str:
-        if User.objects.filter(email__iexact=value.strip().lower()).exists():
-            raise serializers.ValidationError("A user with this email is already registered.")
         return value.strip().lower()
 
+    def validate(self, attrs):
+        # An inactive account with this email is a registration that was never
+        # verified; registering again refreshes it and re-issues the code.
+        pending = _USER_MGR.alias(email_ci=Lower("email")).filter(email_ci=attrs["email"]).first()
+        if pending is not None and pending.is_active:
+            raise serializers.ValidationError({"email": "A user with this email is already registered."})
+        taken = _USER_MGR.alias(username_ci=Lower("username")).filter(username_ci=attrs["username"].lower())
+        if pending is not None:
+            taken = taken.exclude(pk=pending.pk)
+        if taken.exists():
+            raise serializers.ValidationError({"username": "A user with this username already exists."})
+        self.instance = pending
+        return attrs
+
     def validate_password(self, value: str) -> str:
         validate_password(value)
         return value
 
     def create(self, validated_data):
-        user = User.objects.create_user(
+        user = _USER_MGR.create_user(
             username=validated_data["username"],
             email=validated_data["email"],
             password=validated_data["password"],
@@ -43,6 +55,14 @@ class RegisterSerializer(serializers.Serializer):
         )
         return user
 
+    def update(self, instance, validated_data):
+        instance.username = User.normalize_username(validated_data["username"])
+        instance.first_name = validated_data.get("first_name", "")
+        instance.last_name = validated_data.get("last_name", "")
+        instance.set_password(validated_data["password"])
+        instance.save(update_fields=["username", "first_name", "last_name", "password"])
+        return instance
+
 
 class VerifyEmailSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -72,8 +92,23 @@ class LoginSerializer(serializers.Serializer):
 def _build_image_url(request, image_field):
     if not image_field:
         return None
-    url = image_field.url
-    return request.build_absolute_uri(url) if request else url
+    return _absolute_media_url(request, image_field.url)
+
+
+def _absolute_media_url(request, url: str) -> str:
+    if request is None:
+        return url
+    if url.startswith("/") and not url.startswith("//"):
+        # Resolve scheme and host once per request; storage URLs are already quoted.
+        base = getattr(request, "_image_url_base", None)
+        if base is None:
+            base = request._image_url_base = request.build_absolute_uri("/").rstrip("/")
+        return base + url
+    return request.build_absolute_uri(url)
+
+
+# Product columns read by ProductSerializer, for .only() on querysets that feed it.
+PRODUCT_SERIALIZER_COLUMNS = ("id", "name", "price", "short_description", "stock_quantity", "image")
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -97,10 +132,31 @@ class ProductSerializer(serializers.ModelSerializer):
         return _build_image_url(request, obj.image)
 
 
+# Same output as ProductSerializer, built from .values(*PRODUCT_SERIALIZER_COLUMNS) rows
+# so list pages skip per-row field binding.
+def serialize_product_rows(rows, request) -> list[dict]:
+    price_field = ProductSerializer().fields["price"]
+    storage = Product._meta.get_field("image").storage
+    return [
+        {
+            "id": row["id"],
+            "name": row["name"],
+            "price": price_field.to_representation(row["price"]),
+            "short_description": row["short_description"],
+            "stock_quantity": row["stock_quantity"],
+            "in_stock": row["stock_quantity"] > 0,
+            "image_url": _absolute_media_url(request, storage.url(row["image"])) if row["image"] else None,
+        }
+        for row in rows
+    ]
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
-        queryset=Product.objects.filter(is_active=True), source="product", write_only=True
+        queryset=Product.objects.filter(is_active=True).only("id", "price", "stock_quantity"),
+        source="product",
+        write_only=True,
     )
 
     class Meta:
@@ -123,11 +179,20 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ["id", "cart_token", "items", "subtotal", "total_items"]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._totals_cache: dict[int, tuple[Decimal, int]] = {}
+
+    def _totals(self, obj: Cart) -> tuple[Decimal, int]:
+        if obj.pk not in self._totals_cache:
+            self._totals_cache[obj.pk] = obj.totals()
+        return self._totals_cache[obj.pk]
+
     def get_subtotal(self, obj: Cart) -> Decimal:
-        return obj.subtotal()
+        return self._totals(obj)[0]
 
     def get_total_items(self, obj: Cart) -> int:
-        return obj.total_items()
+        return self._totals(obj)[1]
 
     def get_cart_token(self, obj: Cart):
         return str(obj.guest_token) if obj.guest_token else None
@@ -162,12 +227,12 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = OrderItem
-        fields = ["id", "product", "quantity", "unit_price", "line_total"]
+        fields = ["id", "product", "product_name", "quantity", "unit_price", "line_total"]
 
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
-    coupon_code = serializers.SerializerMethodField()
+    coupon_code = serializers.CharField(source="coupon.code", read_only=True, default=None, allow_null=True)
 
     class Meta:
         model = Order
@@ -180,10 +245,8 @@ class OrderSerializer(serializers.ModelSerializer):
             "subtotal_amount",
             "discount_amount",
             "total_amount",
+            "item_count",
             "items",
             "created_at",
         ]
 
-    def get_coupon_code(self, obj: Order):
-        return obj.coupon.code if obj.coupon else None
-
@@ -1,25 +1,40 @@
 from __future__ import annotations
 
+import logging
+import threading
+import time
+from datetime import datetime
 from decimal import Decimal
+from functools import lru_cache
 
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import connection, transaction
+from django.db.models import Count, Max
 
 from shop.constants import (
     DEFAULT_FROM_EMAIL,
     DEFAULT_MIN_ORDER_AMOUNT,
     DEFAULT_OTP_EXPIRE_MINUTES,
+    EMAIL_RETRY_DELAY_SECONDS,
+    EMAIL_SEND_ATTEMPTS,
     SETTING_DEFAULT_FROM_EMAIL,
     SETTING_MIN_ORDER_AMOUNT,
     SETTING_OTP_EXPIRE_MINUTES,
 )
-from shop.models import Order
+from shop.models import EmailChangeRequest, Order, Product
 
+logger = logging.getLogger(__name__)
 
+_STATUS_DISPLAY = dict(Order.Status.choices)
+
+
+@lru_cache(maxsize=1)
 def get_otp_expire_minutes() -> int:
     return getattr(settings, SETTING_OTP_EXPIRE_MINUTES, DEFAULT_OTP_EXPIRE_MINUTES)
 
 
+@lru_cache(maxsize=1)
 def get_min_order_amount() -> Decimal:
     raw = getattr(settings, SETTING_MIN_ORDER_AMOUNT, None) or DEFAULT_MIN_ORDER_AMOUNT
     try:
@@ -28,10 +43,28 @@ def get_min_order_amount() -> Decimal:
         return Decimal("0.00")
 
 
+@lru_cache(maxsize=1)
 def get_from_email() -> str:
     return getattr(settings, SETTING_DEFAULT_FROM_EMAIL, DEFAULT_FROM_EMAIL)
 
 
+def get_products_state() -> tuple[datetime | None, int]:
+    # Read from the database so every worker derives the same validators; the count
+    # catches deletions, which do not move Max(updated_at).
+    state = Product.objects.aggregate(last_modified=Max("updated_at"), count=Count("id"))
+    return state["last_modified"], state["count"]
+
+
+def run_in_background(func, *args, **kwargs) -> None:
+    def _run():
+        try:
+            func(*args, **kwargs)
+        finally:
+            connection.close()
+
+    transaction.on_commit(lambda: threading.Thread(target=_run, daemon=True).start())
+
+
 def send_otp_email(email: str, otp: str) -> None:
     minutes = get_otp_expire_minutes()
     subject = "Your verification code"
@@ -52,6 +85,30 @@ def send_email_change_otp(new_email: str, otp: str) -> None:
     send_mail(subject, message, get_from_email(), [new_email], fail_silently=False)
 
 
+def _send_with_retry(send, *args) -> bool:
+    for attempt in range(1, EMAIL_SEND_ATTEMPTS + 1):
+        try:
+            send(*args)
+            return True
+        except Exception:
+            logger.warning("Email send attempt %d/%d failed", attempt, EMAIL_SEND_ATTEMPTS, exc_info=True)
+            if attempt < EMAIL_SEND_ATTEMPTS:
+                time.sleep(EMAIL_RETRY_DELAY_SECONDS * attempt)
+    return False
+
+
+def deliver_registration_otp(user_id: int, email: str, otp: str) -> None:
+    if not _send_with_retry(send_otp_email, email, otp):
+        # The inactive user is kept; registering again with the same email re-issues the code.
+        logger.error("Could not deliver the registration OTP for user %s to %s", user_id, email)
+
+
+def deliver_email_change_otp(request_id: int, new_email: str, otp: str) -> None:
+    if not _send_with_retry(send_email_change_otp, new_email, otp):
+        logger.error("Could not deliver the email change OTP for request %s to %s", request_id, new_email)
+        EmailChangeRequest.objects.filter(pk=request_id).delete()
+
+
 def send_order_confirmation_email(order: Order) -> None:
     to_email = order.user.email if order.user else order.guest_email
     if not to_email:
@@ -64,17 +121,20 @@ def send_order_confirmation_email(order: Order) -> None:
         f"Discount: {order.discount_amount}",
         f"Total: {order.total_amount}",
     ]
-    for item in order.items.select_related("product").all():
-        lines.append(f"  - {item.product.name} x {item.quantity}: {item.line_total}")
+    if "items" in getattr(order, "_prefetched_objects_cache", {}):
+        rows = ((item.product_name, item.quantity, item.line_total) for item in order.items.all())
+    else:
+        rows = order.items.values_list("product_name", "quantity", "line_total")
+    lines.extend(f"  - {name} x {quantity}: {line_total}" for name, quantity, line_total in rows)
     message = "\n".join(lines)
     send_mail(subject, message, get_from_email(), [to_email], fail_silently=True)
 
 
-def send_order_status_change_email(order: Order) -> None:
+def _order_status_change_message(order: Order) -> EmailMessage | None:
     to_email = order.user.email if order.user else order.guest_email
     if not to_email or not to_email.strip():
-        return
-    status_display = dict(Order.Status.choices).get(order.status, order.status)
+        return None
+    status_display = _STATUS_DISPLAY.get(order.status, order.status)
     subject = f"Order #{order.id} – status updated to {status_display}"
     lines = [
         f"Your order #{order.id} has been updated.",
@@ -82,4 +142,15 @@ def send_order_status_change_email(order: Order) -> None:
         f"Total: PKR {order.total_amount}",
     ]
     message = "\n".join(lines)
-    send_mail(subject, message, get_from_email(), [to_email.strip()], fail_silently=True)
+    return EmailMessage(subject, message, get_from_email(), [to_email.strip()])
+
+
+def send_order_status_change_emails(orders) -> None:
+    messages = [m for m in map(_order_status_change_message, orders) if m is not None]
+    if messages:
+        # One connection for the whole batch instead of one SMTP handshake per order.
+        get_connection(fail_silently=True).send_messages(messages)
+
+
+def send_order_status_change_email(order: Order) -> None:
+    send_order_status_change_emails([order])
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+from shop.constants import (
+    SETTING_DEFAULT_FROM_EMAIL,
+    SETTING_MIN_ORDER_AMOUNT,
+    SETTING_OTP_EXPIRE_MINUTES,
+)
+from shop.services import (
+    get_from_email,
+    get_min_order_amount,
+    get_otp_expire_minutes,
+)
+
+
+@receiver(setting_changed)
+def clear_cached_settings(sender, setting, **kwargs):
+    getter = {
+        SETTING_OTP_EXPIRE_MINUTES: get_otp_expire_minutes,
+        SETTING_MIN_ORDER_AMOUNT: get_min_order_amount,
+        SETTING_DEFAULT_FROM_EMAIL: get_from_email,
+    }.get(setting)
+    if getter is not None:
+        getter.cache_clear()
@@ -1,3 +1,257 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from shop.models import Cart, CartItem, EmailVerificationCode, Product, create_order_from_cart
+from shop.serializers import PRODUCT_SERIALIZER_COLUMNS, ProductSerializer, serialize_product_rows
+from shop.services import deliver_registration_otp
+
+
+class OrderSnapshotTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Mug", price=Decimal("4.50"), stock_quantity=10)
+        self.cart = Cart.objects.create()
+        self.item = CartItem.objects.create(
+            cart=self.cart, product=self.product, quantity=3, unit_price=self.product.price
+        )
+
+    def test_order_stores_product_name_and_item_count(self):
+        order = create_order_from_cart(cart=self.cart, guest_full_name="G", guest_email="g@example.com")
+        self.product.name = "Renamed mug"
+        self.product.save()
+
+        order_item = order.items.get()
+        self.assertEqual(order.item_count, 3)
+        self.assertEqual(order_item.product_name, "Mug")
+        self.assertEqual(str(order_item), "Mug x 3")
+
+    def test_cart_item_str(self):
+        self.assertEqual(str(self.item), "Mug x 3")
+
+
+def _migrate(targets=None):
+    executor = MigrationExecutor(connection)
+    targets = targets or executor.loader.graph.leaf_nodes()
+    executor.migrate(targets)
+    return executor.loader.project_state(targets).apps
+
+
+class MigrationTestCase(TransactionTestCase):
+    def tearDown(self):
+        _migrate()
+
+
+class OrderSnapshotBackfillMigrationTests(MigrationTestCase):
+    migrate_from = [("shop", "0009_emailverificationcode_user")]
+    migrate_to = [("shop", "0010_order_item_snapshots")]
+
+    def test_backfills_product_name_and_item_count(self):
+        apps = _migrate(self.migrate_from)
+        Product = apps.get_model("shop", "Product")
+        Order = apps.get_model("shop", "Order")
+        OrderItem = apps.get_model("shop", "OrderItem")
+
+        product = Product.objects.create(name="Lamp", price=Decimal("10.00"), stock_quantity=5)
+        amounts = {"subtotal_amount": 0, "discount_amount": 0, "total_amount": 0}
+        order = Order.objects.create(**amounts)
+        empty_order = Order.objects.create(**amounts)
+        for quantity in (2, 3):
+            OrderItem.objects.create(
+                order=order,
+                product=product,
+                quantity=quantity,
+                unit_price=Decimal("10.00"),
+                line_total=Decimal("10.00") * quantity,
+            )
+
+        apps = _migrate(self.migrate_to)
+        Order = apps.get_model("shop", "Order")
+        OrderItem = apps.get_model("shop", "OrderItem")
+
+        self.assertEqual(Order.objects.get(pk=order.pk).item_count, 5)
+        self.assertEqual(Order.objects.get(pk=empty_order.pk).item_count, 0)
+        self.assertEqual(set(OrderItem.objects.values_list("product_name", flat=True)), {"Lamp"})
+
+
+class CouponCodeMigrationTests(MigrationTestCase):
+    migrate_from = [("shop", "0005_add_product_image")]
+    migrate_to = [("shop", "0006_uppercase_coupon_codes")]
+
+    def _create_coupon(self, Coupon, code):
+        now = timezone.now()
+        return Coupon.objects.create(code=code, discount_value=Decimal("5.00"), start_at=now, end_at=now)
+
+    def test_uppercases_and_strips_codes(self):
+        Coupon = _migrate(self.migrate_from).get_model("shop", "Coupon")
+        coupon = self._create_coupon(Coupon, " welcome ")
+
+        Coupon = _migrate(self.migrate_to).get_model("shop", "Coupon")
+        self.assertEqual(Coupon.objects.get(pk=coupon.pk).code, "WELCOME")
+
+    def test_aborts_on_codes_differing_only_in_case(self):
+        Coupon = _migrate(self.migrate_from).get_model("shop", "Coupon")
+        self._create_coupon(Coupon, "save10")
+        self._create_coupon(Coupon, "SAVE10")
+
+        with self.assertRaisesMessage(RuntimeError, "SAVE10: 'save10'"):
+            _migrate(self.migrate_to)
+        self.assertEqual(set(Coupon.objects.values_list("code", flat=True)), {"save10", "SAVE10"})
+
+        Coupon.objects.filter(code="save10").update(code="save10-old")
+        Coupon = _migrate(self.migrate_to).get_model("shop", "Coupon")
+        self.assertEqual(set(Coupon.objects.values_list("code", flat=True)), {"SAVE10-OLD", "SAVE10"})
+
+
+class LoginTokenTests(TestCase):
+    def test_login_after_logout_returns_a_live_token(self):
+        get_user_model().objects.create_user(username="ann", email="ann@example.com", password="Sup3rs3cret!")
+        client = APIClient()
+        credentials = {"username": "ann", "password": "Sup3rs3cret!"}
+
+        first = client.post("/api/auth/login/", credentials, format="json").json()["token"]
+        client.credentials(HTTP_AUTHORIZATION=f"Token {first}")
+        self.assertEqual(client.post("/api/auth/logout/").status_code, 204)
+
+        client.credentials()
+        second = client.post("/api/auth/login/", credentials, format="json").json()["token"]
+        self.assertNotEqual(first, second)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {second}")
+        self.assertEqual(client.get("/api/auth/me/").status_code, 200)
+
+
+class RegistrationTests(TestCase):
+    payload = {
+        "username": "bob",
+        "email": "bob@example.com",
+        "first_name": "Bob",
+        "last_name": "Smith",
+        "password": "Sup3rs3cret!",
+    }
+
+    def _register(self, **overrides):
+        return APIClient().post("/api/auth/register/", {**self.payload, **overrides}, format="json")
+
+    @mock.patch("shop.services.time.sleep")
+    @mock.patch("shop.services.send_otp_email", side_effect=OSError("smtp down"))
+    def test_failed_delivery_keeps_the_inactive_user(self, send, sleep):
+        self.assertEqual(self._register().status_code, 201)
+        user = get_user_model().objects.get(email="bob@example.com")
+
+        with self.assertLogs("shop.services", "WARNING") as logs:
+            deliver_registration_otp(user.pk, user.email, "123456")
+
+        self.assertEqual(send.call_count, 3)
+        self.assertIn("Could not deliver the registration OTP", logs.output[-1])
+        self.assertFalse(get_user_model().objects.get(pk=user.pk).is_active)
+
+    def test_registering_again_reissues_the_code_for_an_inactive_user(self):
+        self.assertEqual(self._register().status_code, 201)
+        first = EmailVerificationCode.objects.get(email="bob@example.com")
+
+        response = self._register(email="Bob@Example.com", password="An0ther-secret!")
+
+        self.assertEqual(response.status_code, 201)
+        user = get_user_model().objects.get()
+        self.assertTrue(user.check_password("An0ther-secret!"))
+        second = EmailVerificationCode.objects.get(email="bob@example.com")
+        self.assertEqual(second.user, user)
+        self.assertGreater(second.created_at, first.created_at)
+
+    def test_active_user_and_taken_username_are_rejected(self):
+        get_user_model().objects.create_user(username="Bob", email="other@example.com", password="x")
+        self.assertIn("username", self._register().json())
+
+        get_user_model().objects.create_user(username="carol", email="carol@example.com", password="x")
+        self.assertIn("email", self._register(username="dave", email="carol@example.com").json())
+
+
+class CartItemAddTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Mug", price=Decimal("4.50"), stock_quantity=5)
+        self.client = APIClient()
+        self.token = self.client.get("/api/cart/").json()["cart_token"]
+
+    def _add(self, quantity):
+        return self.client.post(
+            "/api/cart/items/",
+            {"product_id": self.product.pk, "quantity": quantity},
+            format="json",
+            HTTP_X_CART_TOKEN=self.token,
+        )
+
+    def test_repeat_add_increments_within_stock(self):
+        self.assertEqual(self._add(2).status_code, 200)
+        self.assertEqual(self._add(3).status_code, 200)
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+
+        response = self._add(1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Insufficient stock.")
+        self.assertEqual(CartItem.objects.get().quantity, 5)
+
+
+class GuestCartLookupTests(TestCase):
+    def test_checked_out_cart_is_not_reused(self):
+        client = APIClient()
+        token = client.get("/api/cart/").json()["cart_token"]
+        self.assertEqual(client.get("/api/cart/", HTTP_X_CART_TOKEN=token).json()["cart_token"], token)
+
+        Cart.objects.filter(guest_token=token).update(checked_out_at=timezone.now())
+
+        self.assertNotEqual(client.get("/api/cart/", HTTP_X_CART_TOKEN=token).json()["cart_token"], token)
+
+
+class ProductConditionalGetTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Mug", price=Decimal("4.50"), stock_quantity=10)
+        self.client = APIClient()
+
+    def test_list_etag_comes_from_the_database(self):
+        etag = self.client.get("/api/products/")["ETag"]
+        cache.clear()  # e.g. another worker with its own cache
+        self.assertEqual(self.client.get("/api/products/")["ETag"], etag)
+        self.assertEqual(self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.product.stock_quantity = 9
+        self.product.save()
+        response = self.client.get("/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["stock_quantity"], 9)
+
+    def test_checkout_changes_the_product_etag(self):
+        url = f"/api/products/{self.product.pk}/"
+        etag = self.client.get(url)["ETag"]
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2, unit_price=self.product.price)
+        create_order_from_cart(cart=cart, guest_full_name="G", guest_email="g@example.com")
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["stock_quantity"], 8)
+
+    def test_missing_product_has_no_validators(self):
+        response = self.client.get("/api/products/999/")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header("ETag"))
+        self.assertFalse(response.has_header("Last-Modified"))
+
+
+class ProductRowSerializationTests(TestCase):
+    def test_rows_match_product_serializer(self):
+        Product.objects.create(name="Mug", price=Decimal("4.5"), stock_quantity=10, image="products/a b.png")
+        Product.objects.create(name="Lamp", price=Decimal("12.00"), stock_quantity=0, short_description="Warm")
+        request = RequestFactory().get("/api/products/")
+
+        rows = serialize_product_rows(Product.objects.order_by("id").values(*PRODUCT_SERIALIZER_COLUMNS), request)
+        expected = ProductSerializer(Product.objects.order_by("id"), many=True, context={"request": request}).data
+
+        self.assertEqual(rows, [dict(item) for item in expected])
+        self.assertEqual(rows[0]["image_url"], "http://testserver/media/products/a%20b.png")
+        self.assertIsNone(rows[1]["image_url"])